@@ -1,10 +1,15 @@
 import typer
 import ast
 import difflib
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
 from pathlib import Path
-from parser import MathExtractor
+from parser import parse_source
 from optimizer import MathOptimizer
-from rich.console import Console
+from rich.console import Console, Group
 from rich.panel import Panel
 from sympy import sympify, diff as sym_diff, integrate as sym_int
 
@@ -25,73 +30,116 @@ def parse_line_set(spec: str) -> set[int]:
             lines.add(int(part))
     return lines
 
+@lru_cache(maxsize=1024)
+def _diff_cached(src: str, varname: str) -> str:
+    """Source of d(src)/d(varname)."""
+    return str(sym_diff(sympify(src), varname))
+
+@lru_cache(maxsize=1024)
+def _int_cached(src: str, varname: str) -> str:
+    """Source of ∫ src d(varname)."""
+    return str(sym_int(sympify(src), varname))
+
+class CalcTransformer(ast.NodeTransformer):
+    """
+    Differentiates/integrates single-target name assignments whose variable
+    is in diff_vars/int_vars, optionally restricted to diff_lines.
+    """
+    def __init__(self, diff_vars: frozenset[str], int_vars: frozenset[str],
+                 diff_lines: set[int]):
+        self.diff_vars = diff_vars
+        self.int_vars = int_vars
+        self.diff_lines = diff_lines
+
+    def visit_Assign(self, node: ast.Assign):
+        # Only single-target name assignments
+        target = node.targets[0]
+        if isinstance(target, ast.Name) and isinstance(node.value, ast.AST):
+            varname = target.id
+            if varname not in self.diff_vars and varname not in self.int_vars:
+                return node
+            lineno = node.lineno
+            on_line = not self.diff_lines or lineno in self.diff_lines
+            do_diff = varname in self.diff_vars and on_line
+            do_int  = varname in self.int_vars  and on_line
+
+            if do_diff:
+                der = _diff_cached(ast.unparse(node.value), varname)
+                node.value = ast.parse(der).body[0].value
+
+            if do_int:
+                ant = _int_cached(ast.unparse(node.value), varname)
+                node.value = ast.parse(ant).body[0].value
+
+        return node
+
+def _write_atomic(path: Path, data: bytes):
+    """
+    Replace the file behind path (following symlinks) via write-then-rename,
+    so an interrupted run never leaves a partial file. Keeps the file mode.
+    """
+    target = path.resolve()
+    fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        shutil.copymode(target, tmp)
+        os.replace(tmp, target)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
 def process_file(
     path: Path,
     optimizer: MathOptimizer,
     inplace: bool,
     show_diff: bool,
-    diff_vars: set[str],
-    int_vars: set[str],
+    diff_vars: frozenset[str],
+    int_vars: frozenset[str],
     diff_lines: set[int],
 ):
     """
     1) Read source
     2) Optionally differentiate/integrate filtered assigns
     3) Run math-optimization pipeline
-    4) Either overwrite or show unified diff/raw code
+    4) Either overwrite or build unified diff/raw code
+
+    Returns the renderable to print, so files can be processed in worker
+    processes while the parent does all console output.
     """
-    src = path.read_text()
-    tree = ast.parse(src)
+    src = path.read_bytes().decode("utf-8")
+    tree = parse_source(src, str(path))
 
     # 2) Symbolic diff/int pass
     if diff_vars or int_vars or diff_lines:
-        class CalcTransformer(ast.NodeTransformer):
-            def visit_Assign(self, node: ast.Assign):
-                # Only single-target name assignments
-                target = node.targets[0]
-                if isinstance(target, ast.Name) and isinstance(node.value, ast.AST):
-                    varname = target.id
-                    lineno = node.lineno
-                    do_diff = varname in diff_vars and (not diff_lines or lineno in diff_lines)
-                    do_int  = varname in int_vars  and (not diff_lines or lineno in diff_lines)
-
-                    if do_diff:
-                        expr = sympify(ast.unparse(node.value))
-                        der  = sym_diff(expr, varname)
-                        node.value = ast.parse(str(der)).body[0].value
-
-                    if do_int:
-                        expr = sympify(ast.unparse(node.value))
-                        ant  = sym_int(expr, varname)
-                        node.value = ast.parse(str(ant)).body[0].value
-
-                return node
-
-        tree = CalcTransformer().visit(tree)
+        tree = CalcTransformer(diff_vars, int_vars, diff_lines).visit(tree)
 
-    # 3) Math optimization
-    full_src = ast.unparse(tree)
-    extractor = MathExtractor()
-    tree2, _ = extractor.extract(full_src)
-    optimized = ast.unparse(optimizer.optimize_tree(tree2))
+    # 3) Math optimization (files without arithmetic skip straight to output)
+    if not (diff_vars or int_vars) and not any(
+            isinstance(n, ast.BinOp) for n in ast.walk(tree)):
+        full_src = optimized = src
+    else:
+        full_src = ast.unparse(tree)
+        optimized = ast.unparse(optimizer.optimize_tree(tree))
 
     # 4) Output
     if inplace:
-        path.write_text(optimized)
-        console.print(f"✅ Updated: {path}")
-        return
+        _write_atomic(path, optimized.encode("utf-8"))
+        return f"✅ Updated: {path}"
 
     if show_diff:
-        diff_txt = "".join(difflib.unified_diff(
-            full_src.splitlines(keepends=True),
-            optimized.splitlines(keepends=True),
-            fromfile=str(path),
-            tofile="optimized",
-            lineterm="",
-        )) or "[italic]No changes[/italic]"
-        console.print(Panel(diff_txt, title=str(path), border_style="blue"))
-    else:
-        console.print(Panel(optimized, title=str(path), border_style="green"))
+        if full_src == optimized:
+            diff_txt = "[italic]No changes[/italic]"
+        else:
+            diff_txt = "\n".join(difflib.unified_diff(
+                full_src.splitlines(),
+                optimized.splitlines(),
+                fromfile=str(path),
+                tofile="optimized",
+                lineterm="",
+            ))
+        return Panel(diff_txt, title=str(path), border_style="blue")
+    return Panel(optimized, title=str(path), border_style="green")
 
 @app.command()
 def main(
@@ -127,19 +175,50 @@ def main(
         True, "--diff/--no-diff",
         help="Show unified diff instead of raw code"
     ),
+    jobs: int = typer.Option(
+        os.cpu_count() or 1, "-j", "--jobs",
+        help="Number of worker processes (1 = process files serially)"
+    ),
 ):
     """
     Optimize math (and optionally differentiate/integrate) in FILE or all .py under a directory.
     """
-    diff_vars = set(differentiate)
-    int_vars  = set(integrate)
+    diff_vars = frozenset(differentiate)
+    int_vars  = frozenset(integrate)
     lines_set = parse_line_set(diff_lines) if diff_lines else set()
     optimizer = MathOptimizer(expand_polynomials=expand)
 
+    # Sorted so output order does not depend on the filesystem
     paths = ([target] if target.is_file()
-             else sorted(target.glob("**/*.py") if recursive else target.glob("*.py")))
-    for path in paths:
-        process_file(path, optimizer, inplace, diff, diff_vars, int_vars, lines_set)
+             else sorted(target.rglob("*.py") if recursive else target.glob("*.py")))
+    work = partial(process_file, optimizer=optimizer, inplace=inplace, show_diff=diff,
+                   diff_vars=diff_vars, int_vars=int_vars, diff_lines=lines_set)
+
+    # Panels are rendered together at the end; --inplace confirmations are
+    # plain lines, printed as they arrive without rich's highlighter
+    panels = []
+    def emit(result):
+        if isinstance(result, Panel):
+            panels.append(result)
+        else:
+            console.print(result, soft_wrap=True, highlight=False)
+
+    # No more workers than files; a single file never starts a pool
+    jobs = min(jobs, len(paths))
+
+    # SymPy is CPU-bound and GIL-bound, so fan out to processes, not threads.
+    # If a file fails, results for the files before it are still printed.
+    try:
+        if jobs <= 1:
+            for path in paths:
+                emit(work(path))
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                for result in pool.map(work, paths):
+                    emit(result)
+    finally:
+        if panels:
+            console.print(Group(*panels))
 
 if __name__ == "__main__":
     app()
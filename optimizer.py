@@ -1,5 +1,413 @@
 import ast
-from sympy import sympify, simplify, factor, expand
+import copy
+import math
+import operator as op
+from functools import lru_cache
+from sympy import (
+    sympify, simplify, factor, expand, Symbol, Integer, Float,
+    Add, Mul, Pow, Number, S, Basic, preorder_traversal,
+)
+from sympy.core.function import Function
+from sympy.core.mul import _keep_coeff
+from sympy.printing.str import StrPrinter
+
+
+# SymPy expressions are immutable and hashable, so each pipeline stage can
+# be memoized independently and shared across unrelated AST nodes.
+@lru_cache(maxsize=2048)
+def _cached_sympify(s: str):
+    return sympify(s)
+
+
+@lru_cache(maxsize=2048)
+def _cached_simplify(expr):
+    return simplify(expr)
+
+
+@lru_cache(maxsize=2048)
+def _cached_factor(expr):
+    return factor(expr)
+
+
+@lru_cache(maxsize=2048)
+def _cached_expand(expr):
+    return expand(expr)
+
+
+_CONST_OPS = {
+    ast.Add:  op.add,
+    ast.Sub:  op.sub,
+    ast.Mult: op.mul,
+    ast.Div:  op.truediv,
+    ast.Pow:  op.pow,
+}
+
+
+def _try_fold_constants(node: ast.AST):
+    """
+    Evaluate a BinOp tree whose leaves are all numeric literals in plain
+    Python. Returns the folded value, or None if the tree mentions anything
+    else (names, calls, ...) or if the result would differ from SymPy's
+    exact arithmetic (inexact int division, negative int powers).
+    """
+    if isinstance(node, ast.Constant):
+        value = node.value
+        if isinstance(value, (int, float, complex)) and not isinstance(value, bool):
+            return value
+        return None
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        operand = _try_fold_constants(node.operand)
+        if operand is None:
+            return None
+        return -operand if isinstance(node.op, ast.USub) else operand
+    if isinstance(node, ast.BinOp) and type(node.op) in _CONST_OPS:
+        left = _try_fold_constants(node.left)
+        if left is None:
+            return None
+        right = _try_fold_constants(node.right)
+        if right is None:
+            return None
+        both_int = isinstance(left, int) and isinstance(right, int)
+        if isinstance(node.op, ast.Div) and both_int:
+            if right == 0 or left % right:
+                return None
+            return left // right
+        if isinstance(node.op, ast.Pow) and both_int and right < 0:
+            return None
+        try:
+            return _CONST_OPS[type(node.op)](left, right)
+        except (ArithmeticError, ValueError):
+            return None
+    return None
+
+
+_SYMPY_OPS = {**_CONST_OPS, ast.Mod: op.mod}
+
+
+def _ast_to_sympy(node: ast.AST):
+    """
+    Build a SymPy expression straight from an arithmetic AST, skipping the
+    unparse → sympify round-trip. Returns None for anything outside plain
+    arithmetic on names and int/float literals; callers fall back to sympify.
+    """
+    if isinstance(node, ast.Constant):
+        value = node.value
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, int):
+            return Integer(value)
+        if isinstance(value, float):
+            return Float(value)
+        return None
+    if isinstance(node, ast.Name):
+        return Symbol(node.id)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        operand = _ast_to_sympy(node.operand)
+        if operand is None:
+            return None
+        return -operand if isinstance(node.op, ast.USub) else operand
+    if isinstance(node, ast.BinOp) and type(node.op) in _SYMPY_OPS:
+        left = _ast_to_sympy(node.left)
+        if left is None:
+            return None
+        right = _ast_to_sympy(node.right)
+        if right is None:
+            return None
+        return _SYMPY_OPS[type(node.op)](left, right)
+    return None
+
+
+def _neg(node: ast.expr) -> ast.expr:
+    return ast.UnaryOp(op=ast.USub(), operand=node)
+
+
+def _fold_binop(nodes, op_type) -> ast.expr:
+    result = nodes[0]
+    for node in nodes[1:]:
+        result = ast.BinOp(left=result, op=op_type(), right=node)
+    return result
+
+
+def _strip_leading_minus(node: ast.expr):
+    """
+    Remove the unary minus that the source form of ``node`` would start with,
+    if any. Returns (node, stripped). Only the left spine of * and / is
+    followed; anything else that renders with a leading '-' is parenthesized.
+    """
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        return node.operand, True
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Mult, ast.Div)):
+        left, stripped = _strip_leading_minus(node.left)
+        if stripped:
+            return ast.BinOp(left=left, op=node.op, right=node.right), True
+    return node, False
+
+
+@lru_cache(maxsize=None)
+def _prints_as_call(cls) -> bool:
+    """True if StrPrinter renders instances of ``cls`` as plain ``name(args)``."""
+    for base in cls.__mro__:
+        if hasattr(StrPrinter, "_print_" + base.__name__):
+            return base is Function
+    return False
+
+
+def _sympy_to_ast(expr) -> ast.expr:
+    """
+    Emit a Python AST for a SymPy expression without going through
+    ``ast.parse(str(expr))``. Mirrors StrPrinter's layout (term/factor order,
+    numerator/denominator split, sqrt) so the unparsed result is identical;
+    anything not covered here falls back to parsing the printed form.
+    """
+    if expr.is_Symbol:
+        return ast.Name(id=expr.name, ctx=ast.Load())
+    if expr.is_Integer:
+        node = ast.Constant(value=abs(int(expr)))
+        return _neg(node) if expr < 0 else node
+    if expr.is_Rational:
+        num = ast.Constant(value=abs(expr.p))
+        node = ast.BinOp(left=_neg(num) if expr.p < 0 else num,
+                         op=ast.Div(), right=ast.Constant(value=expr.q))
+        return node
+    if expr.is_Float:
+        value = float(str(expr))
+        if value < 0:
+            return _neg(ast.Constant(value=-value))
+        return ast.Constant(value=value)
+    if not expr.is_commutative:
+        return ast.parse(str(expr)).body[0].value
+    if isinstance(expr, Add):
+        terms = [_sympy_to_ast(t) for t in expr.as_ordered_terms()]
+        result = terms[0]
+        for term in terms[1:]:
+            term, negative = _strip_leading_minus(term)
+            result = ast.BinOp(left=result, op=ast.Sub() if negative else ast.Add(),
+                               right=term)
+        return result
+    if isinstance(expr, Mul):
+        args = expr.args
+        if args[0] is S.One or any(
+                isinstance(a, Number) or a.is_Pow and all(ai.is_Integer for ai in a.args)
+                for a in args[1:]):
+            # unevaluated Mul: StrPrinter uses a separate literal layout
+            return ast.parse(str(expr)).body[0].value
+        c, e = expr.as_coeff_Mul()
+        negative = c < 0
+        if negative:
+            expr = _keep_coeff(-c, e)
+        numer, denom = [], []
+        for item in expr.as_ordered_factors():
+            if isinstance(item, Pow) and bool(item.exp.as_coeff_Mul()[0] < 0):
+                if item.exp is S.NegativeOne:
+                    denom.append(_sympy_to_ast(item.base))
+                else:
+                    denom.append(_sympy_to_ast(Pow(item.base, -item.exp, evaluate=False)))
+            elif item.is_Rational:
+                if item.p != 1:
+                    numer.append(_sympy_to_ast(Integer(item.p)))
+                if item.q != 1:
+                    denom.append(ast.Constant(value=item.q))
+            else:
+                numer.append(_sympy_to_ast(item))
+        numer = numer or [ast.Constant(value=1)]
+        if negative:
+            numer[0] = _neg(numer[0])
+        result = _fold_binop(numer, ast.Mult)
+        if denom:
+            result = ast.BinOp(left=result, op=ast.Div(), right=_fold_binop(denom, ast.Mult))
+        return result
+    if isinstance(expr, Pow):
+        sqrt = lambda arg: ast.Call(func=ast.Name(id="sqrt", ctx=ast.Load()),
+                                    args=[arg], keywords=[])
+        if expr.exp is S.Half:
+            return sqrt(_sympy_to_ast(expr.base))
+        if -expr.exp is S.Half:
+            return ast.BinOp(left=ast.Constant(value=1), op=ast.Div(),
+                             right=sqrt(_sympy_to_ast(expr.base)))
+        if expr.exp is S.NegativeOne:
+            return ast.BinOp(left=ast.Constant(value=1), op=ast.Div(),
+                             right=_sympy_to_ast(expr.base))
+        return ast.BinOp(left=_sympy_to_ast(expr.base), op=ast.Pow(),
+                         right=_sympy_to_ast(expr.exp))
+    if _prints_as_call(type(expr)):
+        return ast.Call(func=ast.Name(id=type(expr).__name__, ctx=ast.Load()),
+                        args=[_sympy_to_ast(a) for a in expr.args], keywords=[])
+    return ast.parse(str(expr)).body[0].value
+
+
+def _is_rational_polynomial(expr) -> bool:
+    """
+    True if expr is built only from symbols and rationals with +, * and
+    non-negative integer powers. Algebraic coefficients (sqrt(2), I),
+    named constants and floats do not qualify.
+    """
+    for node in preorder_traversal(expr):
+        if node.is_Symbol or node.is_Rational or node.is_Add or node.is_Mul:
+            continue
+        if node.is_Pow and node.exp.is_Integer and node.exp >= 0:
+            continue
+        return False
+    return True
+
+
+@lru_cache(maxsize=4096)
+def _optimize_expr(sym_expr, expand_polynomials: bool):
+    """
+    Run the SymPy pipeline on an expression and return the optimized SymPy
+    expression. Memoized on (sym_expr, expand_polynomials) so repeated
+    subexpressions only pay for SymPy once per process.
+    """
+    if sym_expr.is_Number:
+        # numbers are already canonical after SymPy's auto-evaluation
+        return sym_expr
+    if _is_rational_polynomial(sym_expr):
+        # factor() maps a polynomial with rational coefficients to one
+        # canonical form on its own, so simplify() would be wasted work
+        folded = sym_expr
+    else:
+        folded = _cached_simplify(sym_expr)
+    factored = _cached_factor(folded)
+    return _cached_expand(factored) if expand_polynomials else factored
+
+
+def _int_ast(value: int) -> ast.expr:
+    node = ast.Constant(value=abs(value))
+    return _neg(node) if value < 0 else node
+
+
+def _scaled_name(coeff: int, name: str) -> ast.expr:
+    """``coeff*name`` laid out the way SymPy prints it (x, -x, 2*x)."""
+    node = ast.Name(id=name, ctx=ast.Load())
+    if coeff == 1:
+        return node
+    if coeff == -1:
+        return _neg(node)
+    return ast.BinOp(left=_int_ast(coeff), op=ast.Mult(), right=node)
+
+
+def _linear_coeffs(node: ast.AST, scale: int, coeffs: dict) -> bool:
+    """
+    Add ``scale * node`` into ``coeffs`` ({name: coefficient}, constant term
+    under None). Returns False unless node is a sum of integer multiples of
+    names and integer literals.
+    """
+    if isinstance(node, ast.Constant):
+        if type(node.value) is not int:
+            return False
+        coeffs[None] = coeffs.get(None, 0) + scale * node.value
+        return True
+    if isinstance(node, ast.Name):
+        coeffs[node.id] = coeffs.get(node.id, 0) + scale
+        return True
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        sign = -1 if isinstance(node.op, ast.USub) else 1
+        return _linear_coeffs(node.operand, sign * scale, coeffs)
+    if isinstance(node, ast.BinOp):
+        if isinstance(node.op, ast.Add):
+            return (_linear_coeffs(node.left, scale, coeffs)
+                    and _linear_coeffs(node.right, scale, coeffs))
+        if isinstance(node.op, ast.Sub):
+            return (_linear_coeffs(node.left, scale, coeffs)
+                    and _linear_coeffs(node.right, -scale, coeffs))
+        if isinstance(node.op, ast.Mult):
+            factor_ = _try_fold_constants(node.left)
+            term = node.right
+            if type(factor_) is not int:
+                factor_ = _try_fold_constants(node.right)
+                term = node.left
+            if type(factor_) is not int:
+                return False
+            return _linear_coeffs(term, scale * factor_, coeffs)
+    return False
+
+
+def _try_linear_fold(node: ast.AST):
+    """
+    Closed-form result for ``a*x + b`` with integer a, b and a single name x,
+    matching what simplify() + factor() would print (content pulled out,
+    e.g. 2*(x + 3)). Returns None for anything else.
+    """
+    coeffs = {}
+    if not _linear_coeffs(node, 1, coeffs):
+        return None
+    b = coeffs.pop(None, 0)
+    names = [name for name, coeff in coeffs.items() if coeff]
+    if len(names) > 1:
+        return None
+    if not names:
+        return _int_ast(b)
+    name = names[0]
+    a = coeffs[name]
+    if b == 0:
+        return _scaled_name(a, name)
+
+    g = math.gcd(a, b) * (1 if a > 0 else -1)
+    a, b = a // g, b // g
+    if g == -1:
+        # factor() leaves a unit-content sum alone, in SymPy's term order
+        a, b = -a, -b
+        if b > 0:
+            return ast.BinOp(left=_int_ast(b), op=ast.Sub(), right=_scaled_name(-a, name))
+    inner = ast.BinOp(left=_scaled_name(a, name), op=ast.Add() if b > 0 else ast.Sub(),
+                      right=ast.Constant(value=abs(b)))
+    if g == 1 or g == -1:
+        return inner
+    return ast.BinOp(left=_int_ast(g), op=ast.Mult(), right=inner)
+
+
+def _is_text(node: ast.AST) -> bool:
+    return (isinstance(node, ast.JoinedStr)
+            or isinstance(node, ast.Constant) and isinstance(node.value, (str, bytes)))
+
+
+def _is_arith(node) -> bool:
+    """
+    True for a BinOp, or a unary +/- applied to one, that does not touch
+    str/bytes literals ('-' * 40 and '%s' % x are not math).
+    """
+    while isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        node = node.operand
+    if not isinstance(node, ast.BinOp):
+        return False
+    return not any(_is_text(child) for child in ast.walk(node))
+
+
+def _structural_key(node):
+    """
+    Hashable key describing an AST subtree's structure: node types, fields,
+    names and (typed) constants. Equal keys mean identical source.
+    """
+    if isinstance(node, ast.AST):
+        return (type(node).__name__,) + tuple(
+            _structural_key(getattr(node, field, None)) for field in node._fields)
+    if isinstance(node, list):
+        return tuple(_structural_key(item) for item in node)
+    return (type(node).__name__, node)
+
+
+def _walk_and_replace(node: ast.AST, replace) -> None:
+    """
+    Replace, in place, every outermost arithmetic expression below ``node``
+    with ``replace(expr)``. A plain field walk: unlike ast.NodeTransformer
+    there is no per-node visitor lookup, and arithmetic subtrees are not
+    descended into.
+    """
+    for field in node._fields:
+        value = getattr(node, field, None)
+        if isinstance(value, list):
+            for i, item in enumerate(value):
+                if not isinstance(item, ast.AST):
+                    continue
+                if _is_arith(item):
+                    value[i] = replace(item)
+                else:
+                    _walk_and_replace(item, replace)
+        elif isinstance(value, ast.AST):
+            if _is_arith(value):
+                setattr(node, field, replace(value))
+            else:
+                _walk_and_replace(value, replace)
+
 
 class MathOptimizer:
     """
@@ -11,32 +419,54 @@ class MathOptimizer:
 
     def __init__(self, expand_polynomials: bool = False):
         self.expand_polynomials = expand_polynomials
+        # trigger sympify's lazy parser imports before the first user file
+        _cached_sympify("x + 1")
 
-    def optimize_node(self, node: ast.BinOp) -> ast.AST:
-        # 1) turn AST node back into source
-        expr_str = ast.unparse(node)
+    def optimize_node(self, node: ast.expr) -> ast.AST:
+        # 0) pure-numeric trees are folded in Python, skipping SymPy entirely
+        folded = _try_fold_constants(node)
+        if folded is not None:
+            return ast.Constant(value=folded)
 
-        # 2) parse into SymPy
-        sym_expr = sympify(expr_str)
+        # 0b) a*x + b in a single name has a closed form; SymPy not needed
+        if not self.expand_polynomials:
+            linear = _try_linear_fold(node)
+            if linear is not None:
+                return linear
 
-        # 3) transforms
-        folded  = simplify(sym_expr)
-        factored = factor(folded)
-        final = expand(factored) if self.expand_polynomials else factored
+        # 1) translate AST into SymPy (via source text only for calls etc.)
+        sym_expr = _ast_to_sympy(node)
+        if sym_expr is None:
+            sym_expr = _cached_sympify(ast.unparse(node))
+            if not isinstance(sym_expr, Basic):
+                # sympify hands back plain Python objects for e.g. [1] * 3
+                return node
 
-        # 4) back to AST
-        return ast.parse(str(final)).body[0].value
+        # 2) SymPy transforms (memoized on the expression)
+        final = _optimize_expr(sym_expr, self.expand_polynomials)
+
+        # 3) back to AST
+        return _sympy_to_ast(final)
 
     def optimize_tree(self, tree: ast.AST) -> ast.AST:
         """
-        Walk the AST, replace every BinOp with its optimized version.
+        Walk the AST, replace every outermost arithmetic expression with its
+        optimized version. Each one is handed to SymPy whole; nested BinOps
+        are never visited, since SymPy canonicalizes the subtree in one pass.
         """
-        class Transformer(ast.NodeTransformer):
-            def __init__(self, optimizer):
-                self.optimizer = optimizer
+        if _is_arith(tree):
+            return ast.fix_missing_locations(self.optimize_node(tree))
+
+        # hash-consing: structurally identical expressions in this tree are
+        # optimized once and the result copied to every other occurrence
+        seen = {}
 
-            def visit_BinOp(self, node):
-                node = self.generic_visit(node)
-                return self.optimizer.optimize_node(node)
+        def replace(node):
+            key = _structural_key(node)
+            if key in seen:
+                return copy.deepcopy(seen[key])
+            seen[key] = optimized = self.optimize_node(node)
+            return optimized
 
-        return Transformer(self).visit(tree)
+        _walk_and_replace(tree, replace)
+        return ast.fix_missing_locations(tree)
@@ -1,5 +1,13 @@
 import ast
 
+def parse_source(source: str, filename: str = "<input>") -> ast.Module:
+    """
+    Parse Python source into a raw AST. CPython's AST optimizer is
+    deliberately not used: it folds 1 / 2 into 0.5 and rewrites non-math
+    code (string repetition, `in` lists), which would leak into the output.
+    """
+    return ast.parse(source, filename)
+
 class MathExtractor(ast.NodeVisitor):
     """
     Walks an AST and collects BinOp nodes.
@@ -16,6 +24,6 @@ class MathExtractor(ast.NodeVisitor):
         Parse Python source into an AST, record all BinOp nodes,
         and return (tree, list_of_binops).
         """
-        tree = ast.parse(source)
+        tree = parse_source(source)
         self.visit(tree)
         return tree, self.nodes
@@ -2,7 +2,7 @@
 
 import ast
 import pytest
-from parser import MathExtractor
+from parser import MathExtractor, parse_source
 from optimizer import MathOptimizer
 from sympy import sympify, integrate as sym_int, diff as sym_diff, Symbol
 
@@ -26,6 +26,12 @@ def test_nested_constants():
     out = ast.unparse(MathOptimizer().optimize_tree(tree)).strip()
     assert out == "result = 16"
 
+def test_whole_rhs_optimized():
+    src = "e = -(x + x)"
+    tree, _ = MathExtractor().extract(src)
+    out = ast.unparse(MathOptimizer().optimize_tree(tree)).strip()
+    assert out == "e = -2 * x"
+
 def test_no_change_for_non_math():
     src = "print('hello')"
     tree, _ = MathExtractor().extract(src)
@@ -115,4 +121,68 @@ def test_simple_integration(src, expected):
 def test_integration_then_folding():
     src = "c = 2 + 3"
     # ∫(2+3)dx = 5*x, folding keeps "5 * x"
-    assert run_int(src) == "c = 5 * x"
\ No newline at end of file
+    assert run_int(src) == "c = 5 * x"
+
+
+# ─── 5) Constant & linear fast-path tests ──────────────────────────────────────
+
+@pytest.mark.parametrize("src, expected", [
+    ("a = 6 / 3",      "a = 2"),
+    ("b = 1 / 2",      "b = 1 / 2"),
+    ("c = 2 ** -1",    "c = 1 / 2"),
+    ("d = -2 * 3 + 1", "d = -5"),
+])
+def test_constant_fast_path(src, expected):
+    tree, _ = MathExtractor().extract(src)
+    out = ast.unparse(MathOptimizer().optimize_tree(tree)).strip()
+    assert out == expected
+
+
+@pytest.mark.parametrize("src, expected", [
+    ("a = 4 * x + 6",      "a = 2 * (2 * x + 3)"),
+    ("b = -(2 * x + 3)",   "b = -2 * x - 3"),
+    ("c = 2 - 3 * x",      "c = 2 - 3 * x"),
+    ("d = x - (x - 1)",    "d = 1"),
+])
+def test_linear_fast_path(src, expected):
+    tree, _ = MathExtractor().extract(src)
+    out = ast.unparse(MathOptimizer().optimize_tree(tree)).strip()
+    assert out == expected
+
+@pytest.mark.parametrize("src, expected", [
+    ("r = (sqrt(2) - 1) ** 3",            "r = -7 + 5 * sqrt(2)"),
+    ("s = (sqrt(3) + x) * (sqrt(3) - x)", "s = 3 - x ** 2"),
+    ("t = (x + 1) * (x - 1)",             "t = (x - 1) * (x + 1)"),
+])
+def test_algebraic_coefficients_still_simplified(src, expected):
+    tree, _ = MathExtractor().extract(src)
+    out = ast.unparse(MathOptimizer().optimize_tree(tree)).strip()
+    assert out == expected
+
+@pytest.mark.parametrize("src, expected", [
+    ("r = 'a' * 3",       "r = 'a' * 3"),
+    ("s = '%s' % x",      "s = '%s' % x"),
+    ("print('-' * 40)",   "print('-' * 40)"),
+    ("t = '-' * (2 + 3)", "t = '-' * 5"),
+    ("l = [1] * 3",       "l = [1] * 3"),
+])
+def test_string_ops_left_alone(src, expected):
+    tree, _ = MathExtractor().extract(src)
+    out = ast.unparse(MathOptimizer().optimize_tree(tree)).strip()
+    assert out == expected
+
+
+# ─── 6) Tree-level caching tests ───────────────────────────────────────────────
+
+def test_repeated_expressions_not_shared():
+    tree, _ = MathExtractor().extract("a = x + x\nb = x + x")
+    out = MathOptimizer().optimize_tree(tree)
+    assert ast.unparse(out) == "a = 2 * x\nb = 2 * x"
+    assert out.body[0].value is not out.body[1].value
+
+
+# ─── 7) Parsing tests ──────────────────────────────────────────────────────────
+
+def test_parse_source_does_not_prefold():
+    src = "a = 1 / 2\nb = '-' * 5\nc = x in [1, 2]"
+    assert ast.unparse(parse_source(src)) == "a = 1 / 2\nb = '-' * 5\nc = x in [1, 2]"